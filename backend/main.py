@@ -1,108 +1,114 @@
-from fastapi import FastAPI, UploadFile, HTTPException, Request, Body
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
-from pydantic import BaseModel
+from dataclasses import dataclass, field
+from functools import lru_cache
 import uuid, os, json, wave
 from array import array
 
 
-STORAGE = os.environ.get('USM_STORAGE_DIR') or os.path.join(os.path.dirname(__file__), 'storage')
-SAMPLES = os.path.join(STORAGE, 'samples')
-PROJECTS = os.path.join(STORAGE, 'projects')
-EXPORTS = os.path.join(STORAGE, 'exports')
-os.makedirs(SAMPLES, exist_ok=True)
-os.makedirs(PROJECTS, exist_ok=True)
-os.makedirs(EXPORTS, exist_ok=True)
-
-app = FastAPI(title='USM Backend')
-
-# CORS for local dev
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=['*'],
-    allow_credentials=True,
-    allow_methods=['*'],
-    allow_headers=['*'],
-)
-
-app.mount('/samples', StaticFiles(directory=SAMPLES), name='samples')
-
-class Project(BaseModel):
-    id: str
-    name: str
-    pads: list
-    pattern: dict
-    transport: dict
-
-@app.get('/health')
-def health():
-    return {'ok': True}
-
-async def _process_upload(request: Request, file: UploadFile | None, payload: bytes | None):
-    if file is not None:
-        contents = await file.read()
-        original_name = file.filename or 'upload.bin'
-    else:
-        body = payload if payload is not None else await request.body()
-        if not body:
-            raise HTTPException(status_code=400, detail='No file provided')
-        contents = body
-        original_name = request.headers.get('x-filename', 'upload.bin')
-
-    ext = os.path.splitext(original_name)[1] or '.bin'
-    sid = str(uuid.uuid4()) + ext
-    path = os.path.join(SAMPLES, sid)
-    with open(path, 'wb') as f:
-        f.write(contents)
-    return {'id': sid, 'url': f'/samples/{sid}', 'name': original_name}
-
-
-try:
-    import multipart  # type: ignore # noqa: F401
-    HAS_MULTIPART = True
-except ImportError:
-    try:
-        import python_multipart  # type: ignore # noqa: F401
-        HAS_MULTIPART = True
-    except ImportError:
-        HAS_MULTIPART = False
+DEFAULT_STORAGE = os.path.join(os.path.dirname(__file__), 'storage')
+
+
+@dataclass
+class Settings:
+    storage_dir: str = DEFAULT_STORAGE
+    # Decode every stored sample while building the app. Combine with a
+    # pre-forking server (e.g. `gunicorn --preload`) so workers inherit the
+    # warmed caches copy-on-write instead of each decoding them again.
+    warmup: bool = False
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            storage_dir=os.environ.get('USM_STORAGE_DIR') or DEFAULT_STORAGE,
+            warmup=os.environ.get('USM_WARMUP', '').lower() in ('1', 'true', 'yes'),
+        )
+
+
+@dataclass
+class Storage:
+    root: str
+    _ready: bool = field(default=False, init=False, repr=False)
+    # sample id -> ((mtime, size), (sample_rate, data)), filled only by
+    # warmup() and never written afterwards, so forked workers can share it.
+    _samples: dict = field(default_factory=dict, init=False, repr=False)
+
+    @property
+    def samples(self) -> str:
+        return os.path.join(self.root, 'samples')
+
+    @property
+    def projects(self) -> str:
+        return os.path.join(self.root, 'projects')
+
+    @property
+    def exports(self) -> str:
+        return os.path.join(self.root, 'exports')
+
+    def ensure(self):
+        if self._ready:
+            return self
+        os.makedirs(self.samples, exist_ok=True)
+        os.makedirs(self.projects, exist_ok=True)
+        os.makedirs(self.exports, exist_ok=True)
+        self._ready = True
+        return self
+
+    def sample_ids(self) -> list:
+        return sorted(os.listdir(self.ensure().samples))
+
+    def load_sample(self, sample_id: str):
+        path = os.path.join(self.samples, sample_id)
+        warmed = self._samples.get(sample_id)
+        if warmed is not None:
+            stamp, loaded = warmed
+            # A warmed entry is a snapshot; ignore it once the file changes.
+            if stamp == _file_stamp(path):
+                return loaded
+        return _load_wav_sample(path)
+
+    def warmup(self) -> int:
+        for sample_id in self.sample_ids():
+            if not sample_id.lower().endswith('.wav'):
+                continue
+            path = os.path.join(self.samples, sample_id)
+            try:
+                self._samples[sample_id] = (_file_stamp(path), _load_wav_sample(path))
+            except (OSError, EOFError, ValueError, wave.Error):
+                # Unsupported samples fail again (with a proper error) on export.
+                continue
+        return len(self._samples)
 
 
-if HAS_MULTIPART:
-    from fastapi import File
+@lru_cache(maxsize=None)
+def _project_model():
+    # Built on first use so importing this module does not pull in pydantic.
+    from pydantic import BaseModel
 
-    @app.post('/samples/upload')
-    async def upload_sample(
-        request: Request,
-        file: UploadFile | None = File(None),
-        payload: bytes | None = Body(default=None),
-    ):
-        return await _process_upload(request, file, payload)
-else:
+    class Project(BaseModel):
+        id: str
+        name: str
+        pads: list
+        pattern: dict
+        transport: dict
 
-    @app.post('/samples/upload')
-    async def upload_sample(request: Request, payload: bytes | None = Body(default=None)):
-        return await _process_upload(request, None, payload)
+    return Project
 
-@app.get('/samples/list')
-def list_samples():
-    return [{'id': f, 'url': f'/samples/{f}'} for f in os.listdir(SAMPLES)]
 
-@app.post('/projects/save')
-async def save_project(p: Project):
-    pid = p.id or str(uuid.uuid4())
-    with open(os.path.join(PROJECTS, pid + '.json'), 'w', encoding='utf-8') as f:
-        f.write(p.model_dump_json())
-    return {'id': pid}
+@lru_cache(maxsize=None)
+def _has_multipart() -> bool:
+    try:
+        import multipart  # type: ignore # noqa: F401
+        return True
+    except ImportError:
+        try:
+            import python_multipart  # type: ignore # noqa: F401
+            return True
+        except ImportError:
+            return False
+
 
-@app.get('/projects/{pid}')
-def load_project(pid: str):
-    path = os.path.join(PROJECTS, pid + '.json')
-    if not os.path.exists(path):
-        return {'error': 'not found'}
-    with open(path, 'r', encoding='utf-8') as f:
-        return json.load(f)
+def _file_stamp(path: str):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
 
 
 def _load_wav_sample(path: str):
@@ -120,7 +126,7 @@ def _load_wav_sample(path: str):
     return sample_rate, data
 
 
-def render_loop_to_wav(project: dict, pid: str, cycles: int) -> str:
+def render_loop_to_wav(project: dict, pid: str, cycles: int, storage: Storage) -> str:
     if cycles < 1:
         raise ValueError('cycles must be at least 1')
 
@@ -157,10 +163,9 @@ def render_loop_to_wav(project: dict, pid: str, cycles: int) -> str:
         sample_id = sample_meta.get('id')
         if not sample_id:
             continue
-        sample_path = os.path.join(SAMPLES, sample_id)
-        if not os.path.exists(sample_path):
+        if not os.path.exists(os.path.join(storage.samples, sample_id)):
             raise ValueError(f'sample {sample_id} not found for pad {pad_id}')
-        rate, data = _load_wav_sample(sample_path)
+        rate, data = storage.load_sample(sample_id)
         if sample_rate is None:
             sample_rate = rate
         elif sample_rate != rate:
@@ -221,7 +226,7 @@ def render_loop_to_wav(project: dict, pid: str, cycles: int) -> str:
         output[i] = int(round(val * 32767))
 
     filename = f"{pid or 'project'}-loop-{cycles}x-{uuid.uuid4().hex}.wav"
-    out_path = os.path.join(EXPORTS, filename)
+    out_path = os.path.join(storage.ensure().exports, filename)
     with wave.open(out_path, 'wb') as wav_file:
         wav_file.setnchannels(1)
         wav_file.setsampwidth(2)
@@ -231,16 +236,119 @@ def render_loop_to_wav(project: dict, pid: str, cycles: int) -> str:
     return out_path
 
 
-@app.get('/projects/{pid}/export')
-def export_project(pid: str, cycles: int = 1):
-    path = os.path.join(PROJECTS, pid + '.json')
-    if not os.path.exists(path):
-        raise HTTPException(status_code=404, detail='project not found')
-    with open(path, 'r', encoding='utf-8') as f:
-        project = json.load(f)
-    try:
-        export_path = render_loop_to_wav(project, pid, cycles)
-    except ValueError as exc:
-        raise HTTPException(status_code=400, detail=str(exc))
-    filename = os.path.basename(export_path)
-    return FileResponse(export_path, media_type='audio/wav', filename=filename)
+def create_app(settings: Settings | None = None):
+    from fastapi import FastAPI, UploadFile, HTTPException, Request, Body
+    from fastapi.middleware.cors import CORSMiddleware
+    from fastapi.staticfiles import StaticFiles
+    from fastapi.responses import FileResponse
+
+    Project = _project_model()
+    settings = settings or Settings.from_env()
+    storage = Storage(settings.storage_dir)
+
+    app = FastAPI(title='USM Backend')
+    app.state.settings = settings
+    app.state.storage = storage
+
+    # CORS for local dev
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=['*'],
+        allow_credentials=True,
+        allow_methods=['*'],
+        allow_headers=['*'],
+    )
+
+    class SampleFiles(StaticFiles):
+        # Storage is created on first use rather than when the app is built.
+        async def check_config(self):
+            storage.ensure()
+            await super().check_config()
+
+    app.mount('/samples', SampleFiles(directory=storage.samples, check_dir=False), name='samples')
+
+    @app.get('/health')
+    def health():
+        return {'ok': True}
+
+    async def _process_upload(request: Request, file: UploadFile | None, payload: bytes | None):
+        if file is not None:
+            contents = await file.read()
+            original_name = file.filename or 'upload.bin'
+        else:
+            body = payload if payload is not None else await request.body()
+            if not body:
+                raise HTTPException(status_code=400, detail='No file provided')
+            contents = body
+            original_name = request.headers.get('x-filename', 'upload.bin')
+
+        ext = os.path.splitext(original_name)[1] or '.bin'
+        sid = str(uuid.uuid4()) + ext
+        path = os.path.join(storage.ensure().samples, sid)
+        with open(path, 'wb') as f:
+            f.write(contents)
+        return {'id': sid, 'url': f'/samples/{sid}', 'name': original_name}
+
+    if _has_multipart():
+        from fastapi import File
+
+        @app.post('/samples/upload')
+        async def upload_sample(
+            request: Request,
+            file: UploadFile | None = File(None),
+            payload: bytes | None = Body(default=None),
+        ):
+            return await _process_upload(request, file, payload)
+    else:
+
+        @app.post('/samples/upload')
+        async def upload_sample(request: Request, payload: bytes | None = Body(default=None)):
+            return await _process_upload(request, None, payload)
+
+    @app.get('/samples/list')
+    def list_samples():
+        return [{'id': f, 'url': f'/samples/{f}'} for f in storage.sample_ids()]
+
+    @app.post('/projects/save')
+    async def save_project(p: Project):
+        pid = p.id or str(uuid.uuid4())
+        with open(os.path.join(storage.ensure().projects, pid + '.json'), 'w', encoding='utf-8') as f:
+            f.write(p.model_dump_json())
+        return {'id': pid}
+
+    @app.get('/projects/{pid}')
+    def load_project(pid: str):
+        path = os.path.join(storage.ensure().projects, pid + '.json')
+        if not os.path.exists(path):
+            return {'error': 'not found'}
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    @app.get('/projects/{pid}/export')
+    def export_project(pid: str, cycles: int = 1):
+        path = os.path.join(storage.ensure().projects, pid + '.json')
+        if not os.path.exists(path):
+            raise HTTPException(status_code=404, detail='project not found')
+        with open(path, 'r', encoding='utf-8') as f:
+            project = json.load(f)
+        try:
+            export_path = render_loop_to_wav(project, pid, cycles, storage)
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc))
+        filename = os.path.basename(export_path)
+        return FileResponse(export_path, media_type='audio/wav', filename=filename)
+
+    if settings.warmup:
+        storage.warmup()
+
+    return app
+
+
+def __getattr__(name: str):
+    # Keep `uvicorn main:app` working without building an app on import.
+    if name == 'app':
+        app = globals()['app'] = create_app()
+        return app
+    if name == 'Project':
+        return _project_model()
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -5,12 +5,13 @@ import subprocess
 import sys
 import wave
 from array import array
-from importlib import reload
 from pathlib import Path
 
 import pytest
 from starlette.requests import Request
 
+from backend.main import Project, Settings, create_app
+
 REPO_ROOT = Path(__file__).resolve().parents[2]
 
 
@@ -57,14 +58,13 @@ def _make_request(filename: str) -> Request:
     return Request(scope, receive)
 
 
-@pytest.fixture()
-def backend_app(tmp_path, monkeypatch):
-    storage_dir = tmp_path / 'storage'
-    monkeypatch.setenv('USM_STORAGE_DIR', str(storage_dir))
-    import backend.main as main_module
+def _endpoint(app, name: str):
+    return next(route.endpoint for route in app.routes if getattr(route, 'name', None) == name)
 
-    main = reload(main_module)
-    return main
+
+@pytest.fixture()
+def backend_app(tmp_path):
+    return create_app(Settings(storage_dir=str(tmp_path / 'storage')))
 
 
 @pytest.fixture()
@@ -72,13 +72,68 @@ def anyio_backend():
     return 'asyncio'
 
 
+def test_import_is_lightweight(tmp_path):
+    storage_dir = tmp_path / 'storage'
+    script = (
+        'import sys\n'
+        'import backend.main\n'
+        "print(sorted(m for m in ('fastapi', 'pydantic') if m in sys.modules))\n"
+    )
+    result = subprocess.run(
+        [sys.executable, '-c', script],
+        cwd=REPO_ROOT,
+        env={**os.environ, 'USM_STORAGE_DIR': str(storage_dir)},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert result.stdout.strip() == '[]'
+    assert not storage_dir.exists()
+
+
+def test_create_app_defers_storage_setup(tmp_path):
+    storage_dir = tmp_path / 'storage'
+    app = create_app(Settings(storage_dir=str(storage_dir)))
+    assert not storage_dir.exists()
+
+    assert _endpoint(app, 'list_samples')() == []
+    assert (storage_dir / 'samples').is_dir()
+    assert (storage_dir / 'exports').is_dir()
+
+
+def test_warmup_decodes_stored_samples(tmp_path):
+    storage_dir = tmp_path / 'storage'
+    samples_dir = storage_dir / 'samples'
+    samples_dir.mkdir(parents=True)
+    sample_buffer, sample_frames, sample_rate = _make_test_tone()
+    (samples_dir / 'tone.wav').write_bytes(sample_buffer.getvalue())
+    (samples_dir / 'notes.bin').write_bytes(b'not audio')
+
+    app = create_app(Settings(storage_dir=str(storage_dir), warmup=True))
+
+    storage = app.state.storage
+    rate, data = storage.load_sample('tone.wav')
+    assert rate == sample_rate
+    assert len(data) == sample_frames
+    assert storage.load_sample('tone.wav')[1] is data
+
+    # Samples added after warmup are decoded per call and not retained.
+    (samples_dir / 'late.wav').write_bytes(sample_buffer.getvalue())
+    assert storage.load_sample('late.wav')[1] is not storage.load_sample('late.wav')[1]
+
+    # Replacing a warmed file on disk bypasses the stale snapshot.
+    short_buffer, short_frames, _ = _make_test_tone(duration=0.05)
+    (samples_dir / 'tone.wav').write_bytes(short_buffer.getvalue())
+    assert len(storage.load_sample('tone.wav')[1]) == short_frames
+
+
 @pytest.mark.anyio()
 async def test_upload_loop_and_export(backend_app):
-    main = backend_app
+    app = backend_app
     sample_buffer, sample_frames, sample_rate = _make_test_tone()
 
     request = _make_request('test-tone.wav')
-    upload_result = await main.upload_sample(request, file=None, payload=sample_buffer.getvalue())
+    upload_result = await _endpoint(app, 'upload_sample')(request, file=None, payload=sample_buffer.getvalue())
     sample_id = upload_result['id']
 
     project_payload = {
@@ -116,12 +171,12 @@ async def test_upload_loop_and_export(backend_app):
         },
     }
 
-    project_model = main.Project(**project_payload)
-    save_result = await main.save_project(project_model)
+    project_model = Project(**project_payload)
+    save_result = await _endpoint(app, 'save_project')(project_model)
     project_id = save_result['id']
 
     cycles = 2
-    export_response = main.export_project(project_id, cycles=cycles)
+    export_response = _endpoint(app, 'export_project')(project_id, cycles=cycles)
     assert export_response.media_type == 'audio/wav'
     export_path = export_response.path
     assert os.path.exists(export_path)
@@ -152,13 +207,13 @@ async def test_upload_loop_and_export(backend_app):
     assert _segment_has_audio(audio_data, third_start, sample_frames)
     assert _segment_has_audio(audio_data, fourth_start, sample_frames)
 
-    exports = os.listdir(main.EXPORTS)
+    exports = os.listdir(app.state.storage.exports)
     assert exports, 'an exported wav file should be written to disk'
 
 
 @pytest.mark.anyio()
 async def test_export_respects_start_offset(backend_app, tmp_path):
-    main = backend_app
+    app = backend_app
 
     output_path = tmp_path / 'trim-demo.wav'
     subprocess.run(
@@ -175,7 +230,7 @@ async def test_export_respects_start_offset(backend_app, tmp_path):
     source_data.frombytes(frames)
 
     request = _make_request('trim-demo.wav')
-    upload_result = await main.upload_sample(request, file=None, payload=output_path.read_bytes())
+    upload_result = await _endpoint(app, 'upload_sample')(request, file=None, payload=output_path.read_bytes())
     sample_id = upload_result['id']
 
     start_offset = 0.75
@@ -219,11 +274,11 @@ async def test_export_respects_start_offset(backend_app, tmp_path):
         },
     }
 
-    project_model = main.Project(**project_payload)
-    save_result = await main.save_project(project_model)
+    project_model = Project(**project_payload)
+    save_result = await _endpoint(app, 'save_project')(project_model)
     project_id = save_result['id']
 
-    export_response = main.export_project(project_id, cycles=1)
+    export_response = _endpoint(app, 'export_project')(project_id, cycles=1)
     assert export_response.media_type == 'audio/wav'
     export_path = export_response.path
     assert os.path.exists(export_path)